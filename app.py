@@ -1,15 +1,21 @@
+import time
+
+# Fallback for process_start_time(), taken before any other import
+MODULE_START_TIME = time.time()
+
 from flask import Flask, render_template, request, jsonify, send_file
-from kokoro import KPipeline
-import soundfile as sf
-import numpy as np
 import os
+import gc
+import sys
 import tempfile
 import threading
-import time
 from datetime import datetime
 import uuid
 import logging
-import torch
+from bundle import read_bundle_manifest
+
+# torch, kokoro, numpy and soundfile are imported on first use so that
+# /health and the web UI are served without loading the model stack
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -19,16 +25,76 @@ app = Flask(__name__)
 
 # Global variables
 pipeline = None
+pipeline_lock = threading.Lock()
+pipeline_last_used = 0.0
+voice_last_used = {}  # Voice name -> last time it was used for generation
 audio_cache = {}  # Store generated audio temporarily
 device_info = {}
+startup_info = {}
+
+# Identical syntheses currently running, keyed by (text, voice, parameters)
+inflight_syntheses = {}
+inflight_lock = threading.Lock()
+
+# Request counters exposed through /metrics
+metrics = {
+    'requests_total': 0,
+    'syntheses_total': 0,
+    'coalesced_requests': 0,
+    'failed_requests': 0,
+    'memory_rejections': 0,
+    'cache_evictions': 0,
+    'voice_unloads': 0,
+    'pipeline_unloads': 0
+}
+metrics_lock = threading.Lock()
 
 # Create temp directory if it doesn't exist
 TEMP_DIR = os.environ.get('TEMP_DIR', '/app/temp')
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Offline bundle built with `python bundle.py`; when set, the model,
+# voices and G2P resources are loaded from here with no network access
+BUNDLE_DIR = os.environ.get('KOKORO_BUNDLE_DIR')
+bundle_manifest = read_bundle_manifest(BUNDLE_DIR) if BUNDLE_DIR else None
+bundle_voices = bundle_manifest['voices'] if bundle_manifest else []  # Voices available in the offline bundle
+
+# Memory governor: usage is measured as process RSS against the budget. As it
+# rises past each ratio, load is shed in order: cached audio is evicted (only
+# when TEMP_DIR is in memory), idle voices and the idle pipeline are unloaded,
+# then large jobs are rejected. It is disabled where current RSS can't be read
+MEMORY_BUDGET_MB = os.environ.get('MEMORY_BUDGET_MB')
+MEMORY_BUDGET_FRACTION = 0.9  # Of the detected container limit, for headroom
+MEMORY_EVICT_CACHE_RATIO = 0.75
+MEMORY_UNLOAD_RATIO = 0.85
+MEMORY_REJECT_RATIO = 0.95
+MEMORY_CHECK_INTERVAL = int(os.environ.get('MEMORY_CHECK_INTERVAL', 15))
+AUDIO_CACHE_GRACE_SECONDS = 60  # Newer audio survives eviction so it can still be fetched
+IDLE_UNLOAD_SECONDS = 300  # Voices and the pipeline must be unused this long to be unloaded
+LARGE_JOB_BYTES = 16 * 1024 * 1024
+CHARS_PER_SECOND = 14  # Rough speaking rate used to size a job before running it
+
+# Post-processing options accepted by /generate; every option is part of the
+# coalescing key and is stored alongside the cached audio
+MODEL_SAMPLE_RATE = 24000
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 22050, 24000, 48000)
+NORMALIZE_MODES = ('none', 'peak', 'lufs')
+SILENCE_THRESHOLD_DB = -40.0  # Relative to the segment peak
+POSTPROCESS_DEFAULTS = {
+    'speed': 1.0,
+    'pitch': 0.0,  # Semitones
+    'trim_silence': False,
+    'normalize': 'none',
+    'target_peak_db': -1.0,
+    'target_lufs': -16.0,
+    'sample_rate': MODEL_SAMPLE_RATE,
+    'pause_ms': 0
+}
+
 def detect_device():
     """Detect available compute device and configure accordingly"""
     global device_info
+    import torch
     
     try:
         # Check if CUDA is available
@@ -64,33 +130,589 @@ def detect_device():
 
 def init_pipeline():
     """Initialize the Kokoro pipeline with automatic device detection"""
-    global pipeline
-    if pipeline is None:
+    global pipeline, pipeline_last_used
+    with pipeline_lock:
+        if pipeline is None:
+            try:
+                logger.info("Initializing Kokoro pipeline...")
+                load_start = time.time()
+                
+                # Detect and configure device
+                detect_device()
+                
+                # Initialize pipeline
+                if BUNDLE_DIR:
+                    pipeline = load_bundle_pipeline(BUNDLE_DIR)
+                else:
+                    from kokoro import KPipeline
+                    pipeline = KPipeline(lang_code='a')
+                
+                # Move to appropriate device if GPU is available
+                if device_info['device'] == 'cuda':
+                    try:
+                        # Try to move model to GPU
+                        if hasattr(pipeline, 'model'):
+                            pipeline.model = pipeline.model.to('cuda')
+                        logger.info("✅ Model loaded on GPU")
+                    except Exception as e:
+                        logger.warning(f"Failed to move model to GPU, using CPU: {e}")
+                        device_info['device'] = 'cpu'
+                
+                # Cold start: torch import, model and G2P load happen here, not at boot
+                startup_info['model_load_seconds'] = round(time.time() - load_start, 3)
+                logger.info(f"Kokoro pipeline initialized successfully on {device_info['type']} in {startup_info['model_load_seconds']:.2f}s")
+                
+            except Exception as e:
+                logger.error(f"Failed to initialize pipeline: {e}")
+                raise
+        
+        # Callers keep this reference, so unloading never pulls it out from under them
+        pipeline_last_used = time.time()
+        return pipeline
+
+def process_start_time():
+    """Wall-clock time the process was started, including interpreter startup.
+
+    Read from /proc on Linux; elsewhere falls back to when app.py started importing.
+    """
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # The command name may contain spaces, so split after its closing parenthesis
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        started_after_boot = int(fields[19]) / os.sysconf('SC_CLK_TCK')  # Field 22: starttime
+        return time.time() - (uptime - started_after_boot)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return MODULE_START_TIME
+
+def increment_metric(name, amount=1):
+    """Increment a request counter in a thread-safe way"""
+    with metrics_lock:
+        metrics[name] = metrics.get(name, 0) + amount
+
+class InFlightSynthesis:
+    """A running synthesis that identical concurrent requests attach to"""
+
+    def __init__(self, key):
+        self.key = key
+        self.nbytes = 0
+        self.done = False
+        self.result = None
+        self.error = None
+        self._condition = threading.Condition()
+
+    def add_segment(self, audio):
+        """Account for the buffer of a newly generated segment"""
+        with self._condition:
+            self.nbytes += getattr(audio, 'nbytes', 0)
+
+    def finish(self, result=None, error=None):
+        """Mark the synthesis as complete and wake up all followers"""
+        with self._condition:
+            self.result = result
+            self.error = error
+            self.done = True
+            self._condition.notify_all()
+
+    def wait(self):
+        """Block until the synthesis finishes and return its result"""
+        with self._condition:
+            while not self.done:
+                self._condition.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def synthesis_key(text, voice, **params):
+    """Build the key identifying identical synthesis requests"""
+    return (text, voice, tuple(sorted(params.items())))
+
+def join_or_start_synthesis(key):
+    """Attach to a running synthesis for key, or register a new one.
+
+    Returns (synthesis, is_leader). Only the leader runs the model.
+    """
+    with inflight_lock:
+        synthesis = inflight_syntheses.get(key)
+        if synthesis is not None:
+            increment_metric('coalesced_requests')
+            return synthesis, False
+        synthesis = InFlightSynthesis(key)
+        inflight_syntheses[key] = synthesis
+        return synthesis, True
+
+def finish_synthesis(synthesis, result=None, error=None):
+    """Unregister a synthesis so later requests start fresh, then publish it"""
+    with inflight_lock:
+        if inflight_syntheses.get(synthesis.key) is synthesis:
+            del inflight_syntheses[synthesis.key]
+    synthesis.finish(result=result, error=error)
+
+def load_bundle_pipeline(bundle_dir):
+    """Build the Kokoro pipeline from an offline bundle without network access"""
+    manifest = read_bundle_manifest(bundle_dir)
+    
+    # Must be in place before huggingface_hub and spaCy are first imported
+    os.environ['HF_HUB_OFFLINE'] = '1'
+    site_dir = os.path.join(bundle_dir, 'site-packages')
+    if os.path.isdir(site_dir) and site_dir not in sys.path:
+        sys.path.insert(0, site_dir)
+    
+    from kokoro import KModel, KPipeline
+    
+    logger.info(f"📦 Loading offline bundle from {bundle_dir}")
+    model = KModel(
+        repo_id=manifest['repo_id'],
+        config=os.path.join(bundle_dir, manifest['config']),
+        model=os.path.join(bundle_dir, manifest['model'])
+    ).eval()
+    
+    # Voices are loaded on demand by ensure_voice_loaded(), so idle ones stay unloaded
+    logger.info(f"{len(manifest['voices'])} bundled voice(s) available")
+    return KPipeline(lang_code=manifest['lang_code'], repo_id=manifest['repo_id'], model=model)
+
+def ensure_voice_loaded(tts, voice):
+    """Return the voice pack, loading it into the pipeline if it is not resident.
+
+    Callers pass the returned pack to the pipeline instead of the voice name, so
+    the memory governor unloading the voice mid-synthesis can't force a reload.
+    """
+    pack = tts.voices.get(voice)
+    if pack is not None:
+        return pack
+    if not BUNDLE_DIR:
+        return tts.load_voice(voice)
+    
+    from safetensors.torch import load_file
+    
+    pack = load_file(os.path.join(BUNDLE_DIR, 'voices', f'{voice}.safetensors'))['pack']
+    tts.voices[voice] = pack
+    return pack
+
+def parse_number_option(data, name, integer=False):
+    """Read a numeric option, rejecting strings, booleans and, if integer, fractional values"""
+    value = data.get(name, POSTPROCESS_DEFAULTS[name])
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number")
+    
+    number = float(value)
+    
+    if integer:
+        if not number.is_integer():
+            raise ValueError(f"{name} must be a whole number")
+        return int(number)
+    return number
+
+def parse_postprocess_options(data):
+    """Validate the post-processing options of a /generate request.
+
+    Raises ValueError with a user-facing message for invalid values.
+    """
+    options = dict(POSTPROCESS_DEFAULTS)
+    
+    for name in ('speed', 'pitch', 'target_peak_db', 'target_lufs'):
+        options[name] = parse_number_option(data, name)
+    for name in ('sample_rate', 'pause_ms'):
+        options[name] = parse_number_option(data, name, integer=True)
+    
+    options['trim_silence'] = data.get('trim_silence', options['trim_silence'])
+    if not isinstance(options['trim_silence'], bool):
+        raise ValueError('trim_silence must be true or false')
+    
+    options['normalize'] = str(data.get('normalize', options['normalize'])).lower()
+    
+    if not 0.5 <= options['speed'] <= 2.0:
+        raise ValueError('Speed must be between 0.5 and 2.0')
+    if not -12.0 <= options['pitch'] <= 12.0:
+        raise ValueError('Pitch must be between -12 and 12 semitones')
+    if options['sample_rate'] not in SUPPORTED_SAMPLE_RATES:
+        raise ValueError(f"Sample rate must be one of {', '.join(str(r) for r in SUPPORTED_SAMPLE_RATES)}")
+    if not 0 <= options['pause_ms'] <= 5000:
+        raise ValueError('Pause must be between 0 and 5000 ms')
+    if options['normalize'] not in NORMALIZE_MODES:
+        raise ValueError(f"Normalize must be one of {', '.join(NORMALIZE_MODES)}")
+    if not -60.0 <= options['target_peak_db'] <= 0.0:
+        raise ValueError('Target peak must be between -60 and 0 dBFS')
+    if not -60.0 <= options['target_lufs'] <= -5.0:
+        raise ValueError('Target loudness must be between -60 and -5 LUFS')
+    
+    return options
+
+def resample_audio(audio, source_rate, target_rate):
+    """Band-limited FFT resampling of a whole segment"""
+    import numpy as np
+    
+    if source_rate == target_rate or len(audio) == 0:
+        return audio
+    
+    target_length = max(1, int(round(len(audio) * target_rate / source_rate)))
+    spectrum = np.fft.rfft(audio)
+    target_bins = target_length // 2 + 1
+    
+    # Drop bins above the new Nyquist when downsampling, zero-pad when upsampling
+    resized = np.zeros(target_bins, dtype=spectrum.dtype)
+    kept = min(target_bins, len(spectrum))
+    resized[:kept] = spectrum[:kept]
+    
+    return np.fft.irfft(resized, n=target_length) * (target_length / len(audio))
+
+def trim_silence(audio, leading=True, trailing=True):
+    """Cut samples quieter than the silence threshold from the chosen edges"""
+    import numpy as np
+    
+    if len(audio) == 0 or not (leading or trailing):
+        return audio
+    
+    threshold = np.max(np.abs(audio)) * 10 ** (SILENCE_THRESHOLD_DB / 20)
+    loud = np.flatnonzero(np.abs(audio) > threshold)
+    if len(loud) == 0:
+        return audio[:0]
+    
+    start = loud[0] if leading else 0
+    end = loud[-1] + 1 if trailing else len(audio)
+    return audio[start:end]
+
+def k_weighting_power(length, sample_rate):
+    """Squared magnitude of the BS.1770 K-weighting filter at each rfft bin"""
+    import numpy as np
+    
+    z = np.exp(-1j * 2 * np.pi * np.fft.rfftfreq(length, 1.0 / sample_rate) / sample_rate)
+    
+    # Stage 1: high shelf (+4 dB above ~1.5 kHz)
+    w0 = 2 * np.pi * 1500.0 / sample_rate
+    alpha = np.sin(w0) / (2 * (1 / np.sqrt(2)))
+    A = 10 ** (4.0 / 40)
+    shelf_b = (
+        A * ((A + 1) + (A - 1) * np.cos(w0) + 2 * np.sqrt(A) * alpha),
+        -2 * A * ((A - 1) + (A + 1) * np.cos(w0)),
+        A * ((A + 1) + (A - 1) * np.cos(w0) - 2 * np.sqrt(A) * alpha)
+    )
+    shelf_a = (
+        (A + 1) - (A - 1) * np.cos(w0) + 2 * np.sqrt(A) * alpha,
+        2 * ((A - 1) - (A + 1) * np.cos(w0)),
+        (A + 1) - (A - 1) * np.cos(w0) - 2 * np.sqrt(A) * alpha
+    )
+    
+    # Stage 2: high pass at 38 Hz
+    w0 = 2 * np.pi * 38.0 / sample_rate
+    alpha = np.sin(w0) / (2 * 0.5)
+    highpass_b = ((1 + np.cos(w0)) / 2, -(1 + np.cos(w0)), (1 + np.cos(w0)) / 2)
+    highpass_a = (1 + alpha, -2 * np.cos(w0), 1 - alpha)
+    
+    power = np.ones(len(z))
+    for b, a in ((shelf_b, shelf_a), (highpass_b, highpass_a)):
+        response = (b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)
+        power *= np.abs(response) ** 2
+    return power
+
+def integrated_loudness(audio, sample_rate):
+    """Gated BS.1770 integrated loudness of a mono segment in LUFS"""
+    import numpy as np
+    
+    if len(audio) == 0:
+        return float('-inf')
+    
+    # Apply K-weighting in the frequency domain
+    weighted = np.fft.irfft(np.fft.rfft(audio) * np.sqrt(k_weighting_power(len(audio), sample_rate)), n=len(audio))
+    
+    # 400 ms blocks with 75% overlap; short segments are measured as one block.
+    # Block powers come from a running sum of squares to stay O(n) in memory
+    block = int(0.4 * sample_rate)
+    if len(weighted) < block:
+        powers = np.array([np.mean(weighted ** 2)])
+    else:
+        energy = np.concatenate([[0.0], np.cumsum(weighted * weighted)])
+        starts = np.arange(0, len(weighted) - block + 1, block // 4)
+        powers = (energy[starts + block] - energy[starts]) / block
+    
+    with np.errstate(divide='ignore'):
+        loudness = -0.691 + 10 * np.log10(powers)
+    
+    # Absolute gate at -70 LUFS, then relative gate 10 LU below the gated mean
+    gated = powers[loudness > -70.0]
+    if len(gated) == 0:
+        return float('-inf')
+    relative_gate = -0.691 + 10 * np.log10(np.mean(gated)) - 10.0
+    gated = powers[(loudness > -70.0) & (loudness > relative_gate)]
+    
+    return float(-0.691 + 10 * np.log10(np.mean(gated)))
+
+def normalize_audio(audio, options, sample_rate):
+    """Apply peak or loudness normalization to a segment"""
+    import numpy as np
+    
+    if options['normalize'] == 'none' or len(audio) == 0:
+        return audio
+    
+    peak = np.max(np.abs(audio))
+    if peak == 0:
+        return audio
+    peak_gain = 10 ** (options['target_peak_db'] / 20) / peak
+    
+    if options['normalize'] == 'peak':
+        gain = peak_gain
+    else:
+        loudness = integrated_loudness(audio, sample_rate)
+        if not np.isfinite(loudness):
+            return audio
+        # Never push peaks above target_peak_db, so loud targets don't clip
+        gain = min(10 ** ((options['target_lufs'] - loudness) / 20), peak_gain)
+    
+    return audio * gain
+
+def postprocess_segment(audio, options, is_first, is_last):
+    """Run the per-request post-processing chain on one generated segment"""
+    import numpy as np
+    
+    if hasattr(audio, 'cpu'):
+        audio = audio.cpu().numpy()
+    audio = np.asarray(audio, dtype=np.float32)
+    sample_rate = options['sample_rate']
+    
+    # Pitch is shifted by resampling; the model speed was already compensated
+    source_rate = MODEL_SAMPLE_RATE * 2 ** (options['pitch'] / 12)
+    audio = resample_audio(audio, source_rate, sample_rate)
+    
+    # Only the edges of the whole output are trimmed, keeping pauses between sentences
+    if options['trim_silence']:
+        audio = trim_silence(audio, leading=is_first, trailing=is_last)
+    
+    audio = normalize_audio(audio, options, sample_rate)
+    
+    if options['pause_ms'] and not is_first:
+        pause = np.zeros(int(sample_rate * options['pause_ms'] / 1000), dtype=audio.dtype)
+        audio = np.concatenate([pause, audio])
+    
+    return audio.astype(np.float32, copy=False)
+
+def mark_last(items):
+    """Yield (index, item, is_last), holding back one item to know which is last"""
+    iterator = iter(items)
+    try:
+        previous = next(iterator)
+    except StopIteration:
+        return
+    
+    index = 0
+    for item in iterator:
+        yield index, previous, False
+        previous = item
+        index += 1
+    yield index, previous, True
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a job is rejected to keep the process within its memory budget"""
+
+def page_size():
+    """Memory page size in bytes, or None where os.sysconf is unavailable (Windows)"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def detect_memory_budget():
+    """Return the memory budget in bytes from the environment, cgroup or system RAM.
+
+    Returns None when no limit can be determined.
+    """
+    if MEMORY_BUDGET_MB:
+        return int(float(MEMORY_BUDGET_MB) * 1024 * 1024)
+    
+    try:
+        limit = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        limit = None
+    
+    # cgroup v2, then v1
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
         try:
-            logger.info("Initializing Kokoro pipeline...")
-            
-            # Detect and configure device
-            detect_device()
-            
-            # Initialize pipeline
-            pipeline = KPipeline(lang_code='a')
-            
-            # Move to appropriate device if GPU is available
-            if device_info['device'] == 'cuda':
-                try:
-                    # Try to move model to GPU
-                    if hasattr(pipeline, 'model'):
-                        pipeline.model = pipeline.model.to('cuda')
-                    logger.info("✅ Model loaded on GPU")
-                except Exception as e:
-                    logger.warning(f"Failed to move model to GPU, using CPU: {e}")
-                    device_info['device'] = 'cpu'
-            
-            logger.info(f"Kokoro pipeline initialized successfully on {device_info['type']}")
-            
-        except Exception as e:
-            logger.error(f"Failed to initialize pipeline: {e}")
-            raise
+            with open(path, 'r') as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # Unlimited v1 cgroups report a value near 2**63
+        if value.isdigit() and int(value) < 2 ** 60:
+            limit = min(int(value), limit) if limit else int(value)
+        break
+    
+    return int(limit * MEMORY_BUDGET_FRACTION) if limit else None
+
+def read_rss_bytes():
+    """Current resident set size of this process, or None where it can't be read.
+
+    Only Linux exposes the current RSS without extra dependencies; the peak RSS
+    from getrusage never goes down, so it is not used as a substitute.
+    """
+    size = page_size()
+    if size is None:
+        return None
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * size
+    except (OSError, ValueError, IndexError):
+        return None
+
+def is_memory_filesystem(path):
+    """Whether path lives on a tmpfs mount, so its files count against memory"""
+    try:
+        with open('/proc/mounts', 'r') as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return False
+    
+    # The longest mount point containing the path is the one it lives on
+    path = os.path.realpath(path)
+    best, fstype = '', None
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        mount_point = fields[1].replace('\\040', ' ')
+        if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) and len(mount_point) > len(best):
+            best, fstype = mount_point, fields[2]
+    return fstype == 'tmpfs'
+
+def tensor_bytes(tensor):
+    """Size of a tensor's data in bytes"""
+    return tensor.numel() * tensor.element_size()
+
+def memory_usage():
+    """Current memory usage by category, in bytes"""
+    tts = pipeline
+    model_bytes = 0
+    gpu_model_bytes = 0
+    voice_bytes = 0
+    if tts is not None:
+        if getattr(tts, 'model', None) is not None:
+            # Parameters on CUDA live in GPU memory, not in the process RSS
+            for p in tts.model.parameters():
+                if p.device.type == 'cuda':
+                    gpu_model_bytes += tensor_bytes(p)
+                else:
+                    model_bytes += tensor_bytes(p)
+        voice_bytes = sum(tensor_bytes(pack) for pack in list(tts.voices.values()))
+    
+    with inflight_lock:
+        syntheses = list(inflight_syntheses.values())
+    
+    cached_audio = sum(entry.get('size_bytes', 0) for entry in list(audio_cache.values()))
+    rss = read_rss_bytes() if MEMORY_GOVERNOR_ENABLED else None
+    return {
+        'enabled': MEMORY_GOVERNOR_ENABLED,
+        'budget': MEMORY_BUDGET,
+        'rss': rss,
+        'usage_ratio': round(rss / MEMORY_BUDGET, 4) if rss is not None else None,
+        'memory': {
+            'model': model_bytes,
+            'voices': voice_bytes,
+            'inflight_buffers': sum(synthesis.nbytes for synthesis in syntheses),
+            'cached_audio': cached_audio if TEMP_DIR_IN_MEMORY else 0
+        },
+        'gpu': {
+            'model': gpu_model_bytes
+        },
+        'disk': {
+            'cached_audio': 0 if TEMP_DIR_IN_MEMORY else cached_audio
+        },
+        'resident_voices': sorted(tts.voices) if tts is not None else [],
+        'cached_audio_entries': len(audio_cache),
+        'inflight_syntheses': len(syntheses)
+    }
+
+def unload_idle_voices():
+    """Drop voice packs that are unused and not needed by a running synthesis"""
+    tts = pipeline
+    if tts is None:
+        return []
+    
+    unloaded = []
+    for voice in list(tts.voices):
+        # Re-check under the lock for each voice so a synthesis that just started is seen
+        with inflight_lock:
+            busy = any(synthesis.key[1] == voice for synthesis in inflight_syntheses.values())
+            if busy or time.time() - voice_last_used.get(voice, 0) < IDLE_UNLOAD_SECONDS:
+                continue
+            tts.voices.pop(voice, None)
+        unloaded.append(voice)
+    
+    if unloaded:
+        increment_metric('voice_unloads', len(unloaded))
+        logger.info(f"🧹 Unloaded idle voices: {', '.join(unloaded)}")
+    return unloaded
+
+def unload_idle_pipeline():
+    """Drop the language pipeline and model when no synthesis is running"""
+    global pipeline
+    with pipeline_lock:
+        with inflight_lock:
+            busy = bool(inflight_syntheses)
+        if pipeline is None or busy or time.time() - pipeline_last_used < IDLE_UNLOAD_SECONDS:
+            return False
+        pipeline = None
+    
+    increment_metric('pipeline_unloads')
+    logger.info("🧹 Unloaded idle Kokoro pipeline")
+    return True
+
+def release_memory():
+    """Return freed Python and CUDA memory after unloading"""
+    gc.collect()
+    if 'torch' in sys.modules and sys.modules['torch'].cuda.is_available():
+        sys.modules['torch'].cuda.empty_cache()
+
+def enforce_memory_budget():
+    """Shed load in order until usage is back under each threshold.
+
+    Returns the usage measured after shedding.
+    """
+    usage = memory_usage()
+    if usage['usage_ratio'] is None:
+        return usage
+    
+    # Cached audio on disk doesn't count towards RSS, so deleting it frees nothing
+    if TEMP_DIR_IN_MEMORY and usage['usage_ratio'] >= MEMORY_EVICT_CACHE_RATIO and audio_cache:
+        evicted = cleanup_old_files(max_age=AUDIO_CACHE_GRACE_SECONDS)
+        if evicted:
+            increment_metric('cache_evictions', evicted)
+            logger.warning(f"⚠️ Memory at {usage['usage_ratio']:.0%} of budget, evicted {evicted} cached audio file(s)")
+            usage = memory_usage()
+    
+    if usage['usage_ratio'] >= MEMORY_UNLOAD_RATIO:
+        logger.warning(f"⚠️ Memory at {usage['usage_ratio']:.0%} of budget, unloading idle voices and pipeline")
+        voices_unloaded = unload_idle_voices()
+        pipeline_unloaded = unload_idle_pipeline()
+        if voices_unloaded or pipeline_unloaded:
+            release_memory()
+            usage = memory_usage()
+    
+    return usage
+
+def estimate_job_bytes(text, options):
+    """Rough peak buffer size of a synthesis, sized before it runs"""
+    seconds = len(text) / (CHARS_PER_SECOND * options['speed'])
+    seconds += seconds / 5 * options['pause_ms'] / 1000  # About one segment every 5 seconds
+    sample_rate = max(options['sample_rate'], MODEL_SAMPLE_RATE)
+    
+    # Raw model output, processed segments and the concatenated float32 result
+    return int(seconds * sample_rate * 4 * 3)
+
+def check_memory_admission(text, options):
+    """Raise MemoryBudgetExceeded if a new job would not fit in the budget"""
+    usage = enforce_memory_budget()
+    if usage['usage_ratio'] is None:
+        return
+    job_bytes = estimate_job_bytes(text, options)
+    
+    if usage['rss'] + job_bytes > MEMORY_BUDGET:
+        reason = f"needs ~{job_bytes // (1024 * 1024)} MB with {usage['usage_ratio']:.0%} of the memory budget in use"
+    elif usage['usage_ratio'] >= MEMORY_REJECT_RATIO and job_bytes >= LARGE_JOB_BYTES:
+        reason = f"large jobs are rejected while {usage['usage_ratio']:.0%} of the memory budget is in use"
+    else:
+        return
+    
+    increment_metric('memory_rejections')
+    logger.warning(f"⚠️ Rejecting job of {len(text)} characters: {reason}")
+    raise MemoryBudgetExceeded(f"Server is low on memory, please retry later or send shorter text ({reason})")
 
 @app.route('/')
 def index():
@@ -103,14 +725,38 @@ def health():
     return jsonify({
         'status': 'healthy', 
         'timestamp': datetime.now().isoformat(),
-        'device': device_info
+        'device': device_info,
+        'startup': startup_info
     })
 
 @app.route('/device-info')
 def get_device_info():
     """Get current device information"""
+    # Detecting the device imports torch, so wait until the pipeline has loaded it
+    if not device_info:
+        return jsonify({'type': 'pending'})
     return jsonify(device_info)
 
+@app.route('/metrics')
+def get_metrics():
+    """Get request and coalescing counters"""
+    with metrics_lock:
+        snapshot = dict(metrics)
+    with inflight_lock:
+        snapshot['inflight_syntheses'] = len(inflight_syntheses)
+    return jsonify(snapshot)
+
+@app.route('/memory')
+def get_memory():
+    """Get memory usage by category against the budget"""
+    usage = memory_usage()
+    usage['thresholds'] = {
+        'evict_cache': MEMORY_EVICT_CACHE_RATIO,
+        'unload_idle': MEMORY_UNLOAD_RATIO,
+        'reject_large_jobs': MEMORY_REJECT_RATIO
+    }
+    return jsonify(usage)
+
 @app.route('/generate', methods=['POST'])
 def generate_audio():
     """Generate audio from text"""
@@ -122,83 +768,141 @@ def generate_audio():
         if not text:
             return jsonify({'error': 'Please enter some text'}), 400
         
-        logger.info(f"Generating audio for voice: {voice}, text length: {len(text)} on {device_info.get('type', 'Unknown')}")
-        
-        # Initialize pipeline if needed
-        init_pipeline()
-        
-        # Generate audio with device-specific settings
-        start_time = time.time()
-        
-        if device_info.get('device') == 'cuda':
-            # GPU generation
-            with torch.cuda.device(0):
-                generator = pipeline(text, voice=voice)
-                audio_segments = []
-                
-                for i, (gs, ps, audio) in enumerate(generator):
-                    # Move audio to CPU for saving
-                    if hasattr(audio, 'cpu'):
-                        audio = audio.cpu().numpy()
-                    audio_segments.append(audio)
-                    logger.debug(f"Generated segment {i} on GPU: {gs}, {ps}")
-        else:
-            # CPU generation
-            generator = pipeline(text, voice=voice)
-            audio_segments = []
-            
-            for i, (gs, ps, audio) in enumerate(generator):
-                audio_segments.append(audio)
-                logger.debug(f"Generated segment {i} on CPU: {gs}, {ps}")
-        
-        generation_time = time.time() - start_time
-        
-        # Concatenate all segments
-        if len(audio_segments) > 1:
-            full_audio = np.concatenate(audio_segments)
-        else:
-            full_audio = audio_segments[0]
-        
-        # Generate unique ID for this audio
-        audio_id = str(uuid.uuid4())
+        # Bundled deployments can only serve the voices packed into the bundle
+        if BUNDLE_DIR and voice not in bundle_voices:
+            return jsonify({'error': f"Voice '{voice}' is not included in the offline bundle"}), 400
         
-        # Save to temporary file in the temp directory
-        temp_file = tempfile.NamedTemporaryFile(
-            suffix='.wav', 
-            delete=False, 
-            dir=TEMP_DIR
-        )
-        temp_file.close()
+        try:
+            options = parse_postprocess_options(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        sf.write(temp_file.name, full_audio, 24000)
+        increment_metric('requests_total')
         
-        # Store in cache
-        audio_cache[audio_id] = {
-            'file_path': temp_file.name,
-            'created_at': time.time(),
-            'text': text,
-            'voice': voice,
-            'device': device_info['type'],
-            'generation_time': generation_time
-        }
+        # Attach to an identical synthesis that is already running, if any
+        synthesis, is_leader = join_or_start_synthesis(synthesis_key(text, voice, **options))
         
-        # Clean up old files (older than 1 hour)
-        cleanup_old_files()
+        if not is_leader:
+            logger.info(f"Coalescing request for voice: {voice}, text length: {len(text)} with in-flight synthesis")
+            result = synthesis.wait()
+            return jsonify(dict(result, coalesced=True))
         
-        logger.info(f"Audio generated successfully for ID: {audio_id} in {generation_time:.2f}s on {device_info['type']}")
+        # Always finish the synthesis, even on BaseException, so followers never hang
+        result = None
+        error = RuntimeError('Synthesis was interrupted')
+        try:
+            check_memory_admission(text, options)
+            result = synthesize_audio(synthesis, text, voice, options)
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            finish_synthesis(synthesis, result=result, error=error)
         
-        return jsonify({
-            'success': True,
-            'audio_id': audio_id,
-            'message': f'Audio generated successfully on {device_info["type"]} in {generation_time:.2f}s!',
-            'device': device_info['type'],
-            'generation_time': generation_time
-        })
+        return jsonify(dict(result, coalesced=False))
         
+    except MemoryBudgetExceeded as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
+        increment_metric('failed_requests')
         logger.error(f"Error generating audio: {e}")
         return jsonify({'error': f'Failed to generate audio: {str(e)}'}), 500
 
+def synthesize_audio(synthesis, text, voice, options):
+    """Run the model for a request, tracking each post-processed segment"""
+    logger.info(f"Generating audio for voice: {voice}, text length: {len(text)} on {device_info.get('type', 'Unknown')}")
+    increment_metric('syntheses_total')
+    
+    # Initialize pipeline if needed
+    tts = init_pipeline()
+    
+    import numpy as np
+    import soundfile as sf
+    import torch
+    
+    # Marked as used before loading so the governor doesn't unload it in between
+    voice_last_used[voice] = time.time()
+    pack = ensure_voice_loaded(tts, voice)
+    
+    # Raising the pitch by resampling shortens the audio, so the model speaks
+    # slower by the same factor to keep the requested speed
+    model_speed = options['speed'] / 2 ** (options['pitch'] / 12)
+    
+    # Generate audio with device-specific settings
+    start_time = time.time()
+    audio_segments = []
+    
+    if device_info.get('device') == 'cuda':
+        # GPU generation
+        with torch.cuda.device(0):
+            generator = tts(text, voice=pack, speed=model_speed)
+            
+            for i, (gs, ps, audio), is_last in mark_last(generator):
+                # Move audio to CPU for saving
+                if hasattr(audio, 'cpu'):
+                    audio = audio.cpu().numpy()
+                audio = postprocess_segment(audio, options, is_first=(i == 0), is_last=is_last)
+                audio_segments.append(audio)
+                synthesis.add_segment(audio)
+                logger.debug(f"Generated segment {i} on GPU: {gs}, {ps}")
+    else:
+        # CPU generation
+        generator = tts(text, voice=pack, speed=model_speed)
+        
+        for i, (gs, ps, audio), is_last in mark_last(generator):
+            audio = postprocess_segment(audio, options, is_first=(i == 0), is_last=is_last)
+            audio_segments.append(audio)
+            synthesis.add_segment(audio)
+            logger.debug(f"Generated segment {i} on CPU: {gs}, {ps}")
+    
+    generation_time = time.time() - start_time
+    
+    # Concatenate all segments
+    if len(audio_segments) > 1:
+        full_audio = np.concatenate(audio_segments)
+    else:
+        full_audio = audio_segments[0]
+    
+    # Generate unique ID for this audio
+    audio_id = str(uuid.uuid4())
+    
+    # Save to temporary file in the temp directory
+    temp_file = tempfile.NamedTemporaryFile(
+        suffix='.wav', 
+        delete=False, 
+        dir=TEMP_DIR
+    )
+    temp_file.close()
+    
+    sf.write(temp_file.name, full_audio, options['sample_rate'])
+    
+    # Store in cache
+    audio_cache[audio_id] = {
+        'file_path': temp_file.name,
+        'created_at': time.time(),
+        'text': text,
+        'voice': voice,
+        'device': device_info['type'],
+        'generation_time': generation_time,
+        'options': options,
+        'size_bytes': os.path.getsize(temp_file.name)
+    }
+    
+    # Clean up old files (older than 1 hour)
+    cleanup_old_files()
+    
+    logger.info(f"Audio generated successfully for ID: {audio_id} in {generation_time:.2f}s on {device_info['type']}")
+    
+    return {
+        'success': True,
+        'audio_id': audio_id,
+        'message': f'Audio generated successfully on {device_info["type"]} in {generation_time:.2f}s!',
+        'device': device_info['type'],
+        'generation_time': generation_time,
+        'sample_rate': options['sample_rate']
+    }
+
 @app.route('/audio/<audio_id>')
 def get_audio(audio_id):
     """Serve audio file"""
@@ -231,13 +935,16 @@ def download_audio(audio_id):
     
     return send_file(file_path, as_attachment=True, download_name=filename)
 
-def cleanup_old_files():
-    """Clean up audio files older than 1 hour"""
+def cleanup_old_files(max_age=3600):
+    """Clean up audio files older than max_age seconds (default 1 hour)
+
+    Returns the number of files removed.
+    """
     current_time = time.time()
     to_remove = []
     
-    for audio_id, data in audio_cache.items():
-        if current_time - data['created_at'] > 3600:  # 1 hour
+    for audio_id, data in list(audio_cache.items()):
+        if current_time - data['created_at'] > max_age:
             try:
                 os.unlink(data['file_path'])
                 logger.info(f"Cleaned up old audio file: {data['file_path']}")
@@ -246,7 +953,9 @@ def cleanup_old_files():
             to_remove.append(audio_id)
     
     for audio_id in to_remove:
-        del audio_cache[audio_id]
+        audio_cache.pop(audio_id, None)
+    
+    return len(to_remove)
 
 # Background cleanup task
 def periodic_cleanup():
@@ -255,10 +964,36 @@ def periodic_cleanup():
         time.sleep(1800)  # 30 minutes
         cleanup_old_files()
 
+# Background memory governor
+def periodic_memory_check():
+    """Enforce the memory budget every MEMORY_CHECK_INTERVAL seconds"""
+    while True:
+        time.sleep(MEMORY_CHECK_INTERVAL)
+        try:
+            enforce_memory_budget()
+        except Exception as e:
+            logger.warning(f"Memory check failed: {e}")
+
+MEMORY_BUDGET = detect_memory_budget()
+MEMORY_GOVERNOR_ENABLED = MEMORY_BUDGET is not None and read_rss_bytes() is not None
+TEMP_DIR_IN_MEMORY = is_memory_filesystem(TEMP_DIR)
+if not MEMORY_GOVERNOR_ENABLED:
+    logger.warning("⚠️ Memory governor disabled: current RSS or the memory limit can't be read on this platform")
+
 # Start background cleanup thread
 cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
 cleanup_thread.start()
 
+# Start background memory governor thread
+if MEMORY_GOVERNOR_ENABLED:
+    memory_thread = threading.Thread(target=periodic_memory_check, daemon=True)
+    memory_thread.start()
+
+# The model stack is loaded on the first generation, so the app is ready once
+# the module is imported; this also covers servers like gunicorn
+startup_info['ready_seconds'] = round(time.time() - process_start_time(), 3)
+startup_info['offline_bundle'] = BUNDLE_DIR
+
 if __name__ == '__main__':
     # Create templates directory and HTML file if they don't exist
     os.makedirs('templates', exist_ok=True)
@@ -608,12 +1343,17 @@ if __name__ == '__main__':
     <script>
         let currentAudioId = null;
         
-        // Load device info when page loads
-        window.addEventListener('load', async function() {
+        // The device is only known once the model has loaded on first generation
+        async function loadDeviceInfo() {
             try {
                 const response = await fetch('/device-info');
                 const deviceInfo = await response.json();
                 
+                if (deviceInfo.type === 'pending') {
+                    document.getElementById('deviceInfo').innerHTML = '⏳ Compute device is detected on first generation';
+                    return;
+                }
+                
                 let deviceIcon = deviceInfo.type === 'CUDA' ? '🚀' : '🖥️';
                 let deviceText = deviceInfo.type === 'CUDA' 
                     ? `GPU: ${deviceInfo.name}` 
@@ -623,7 +1363,10 @@ if __name__ == '__main__':
             } catch (error) {
                 console.error('Failed to load device info:', error);
             }
-        });
+        }
+        
+        // Load device info when page loads
+        window.addEventListener('load', loadDeviceInfo);
         
         document.getElementById('ttsForm').addEventListener('submit', async function(e) {
             e.preventDefault();
@@ -658,6 +1401,7 @@ if __name__ == '__main__':
                     currentAudioId = data.audio_id;
                     showStatus(data.message, 'success');
                     showAudioControls();
+                    loadDeviceInfo();
                     
                     // Load and play audio
                     const audioPlayer = document.getElementById('audioPlayer');
@@ -719,11 +1463,15 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     host = os.environ.get('HOST', '0.0.0.0')
     
-    # Detect device on startup
-    detect_device()
+    # Measured again right before serving, after the template setup above
+    startup_info['ready_seconds'] = round(time.time() - process_start_time(), 3)
     
     logger.info(f"🎵 Kokoro TTS Flask App Starting on {host}:{port}")
-    logger.info(f"💻 Compute Device: {device_info['type']} - {device_info['name']}")
+    logger.info(f"⏱️ Process start to ready: {startup_info['ready_seconds']:.2f}s")
+    logger.info(f"📦 Offline bundle: {BUNDLE_DIR or 'disabled (models fetched from HuggingFace)'}")
+    logger.info("💻 Compute device and model load time (model_load_seconds in /health) are reported on first generation")
+    if MEMORY_GOVERNOR_ENABLED:
+        logger.info(f"🧠 Memory budget: {MEMORY_BUDGET // (1024 * 1024)} MB (usage: /memory)")
     logger.info("📍 Docker Health Check: /health")
     logger.info("🔧 Use Ctrl+C to stop the server")
     
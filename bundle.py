@@ -0,0 +1,111 @@
+"""Build an offline Kokoro bundle: model weights, voice packs and G2P resources.
+
+Kept separate from app.py so the Docker image can build the bundle in a layer
+that does not depend on the application code.
+
+Usage:
+    python bundle.py --output bundle --voices all
+    python bundle.py --output bundle --voices af_heart,am_adam
+"""
+import os
+import json
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BUNDLE_REPO_ID = 'hexgrad/Kokoro-82M'
+BUNDLE_MODEL_FILE = 'kokoro-v1_0.pth'
+BUNDLE_MANIFEST = 'manifest.json'
+SPACY_MODEL = 'en_core_web_sm'
+
+def list_repo_voices():
+    """Every voice pack published in the Kokoro repository"""
+    from huggingface_hub import list_repo_files
+
+    return sorted(
+        os.path.splitext(os.path.basename(path))[0]
+        for path in list_repo_files(BUNDLE_REPO_ID)
+        if path.startswith('voices/') and path.endswith('.pt')
+    )
+
+def bundle_g2p_resources(output_dir, lang_code):
+    """Copy the installed spaCy model used by English G2P into the bundle"""
+    if lang_code not in ('a', 'b'):
+        return []
+
+    import importlib.metadata
+
+    dist = importlib.metadata.distribution(SPACY_MODEL)
+    source_dir = str(dist.locate_file(''))
+    site_dir = os.path.join(output_dir, 'site-packages')
+    dist_info = f"{dist.metadata['Name'].replace('-', '_')}-{dist.version}.dist-info"
+
+    for name in (SPACY_MODEL, dist_info):
+        shutil.copytree(os.path.join(source_dir, name), os.path.join(site_dir, name), dirs_exist_ok=True)
+
+    logger.info(f"Bundled G2P resources: {SPACY_MODEL} {dist.version}")
+    return [f"{SPACY_MODEL}=={dist.version}"]
+
+def build_bundle(output_dir, voices, lang_code='a'):
+    """Pack model weights, voice packs and G2P resources for offline serving"""
+    import torch
+    from huggingface_hub import hf_hub_download
+    from safetensors.torch import save_file
+
+    if voices == ['all']:
+        voices = list_repo_voices()
+
+    logger.info(f"📦 Building offline bundle in {output_dir} for voices: {', '.join(voices)}")
+    os.makedirs(os.path.join(output_dir, 'voices'), exist_ok=True)
+
+    # Download into a throwaway cache so the weights are not also left in HF_HOME
+    with tempfile.TemporaryDirectory() as download_dir:
+        # Model config and weights are copied as-is; KModel loads them from a local path
+        for filename in ('config.json', BUNDLE_MODEL_FILE):
+            path = hf_hub_download(repo_id=BUNDLE_REPO_ID, filename=filename, cache_dir=download_dir)
+            shutil.copy(path, os.path.join(output_dir, filename))
+
+        # Voice packs are stored as safetensors so they are memory-mapped on load
+        for voice in voices:
+            path = hf_hub_download(repo_id=BUNDLE_REPO_ID, filename=f'voices/{voice}.pt', cache_dir=download_dir)
+            pack = torch.load(path, map_location='cpu', weights_only=True)
+            save_file({'pack': pack.contiguous()}, os.path.join(output_dir, 'voices', f'{voice}.safetensors'))
+            logger.info(f"Bundled voice: {voice}")
+
+    manifest = {
+        'repo_id': BUNDLE_REPO_ID,
+        'lang_code': lang_code,
+        'config': 'config.json',
+        'model': BUNDLE_MODEL_FILE,
+        'voices': voices,
+        'g2p': bundle_g2p_resources(output_dir, lang_code),
+        'created_at': datetime.now().isoformat()
+    }
+    with open(os.path.join(output_dir, BUNDLE_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(f"✅ Offline bundle ready: {output_dir}")
+    return manifest
+
+def read_bundle_manifest(bundle_dir):
+    """Load the manifest of an offline bundle"""
+    manifest_path = os.path.join(bundle_dir, BUNDLE_MANIFEST)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No offline bundle found at {bundle_dir}, run `python bundle.py` first")
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the Kokoro model, voices and G2P resources for offline serving')
+    parser.add_argument('--output', default='bundle', help='Bundle directory (default: bundle)')
+    parser.add_argument('--voices', default='all', help='Comma-separated voices to include, or "all" (default: all)')
+    args = parser.parse_args()
+
+    build_bundle(args.output, [v.strip() for v in args.voices.split(',') if v.strip()])